@@ -4,13 +4,31 @@ Converts virtually any GPS collar CSV data into a standardised format:
     serialnumber;time;latitude;longitude
 """
 
+from __future__ import annotations
+
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import pandas as pd
 import csv
+import importlib
 import os
-import webbrowser
+from concurrent.futures import Future, ThreadPoolExecutor
 from datetime import datetime
+from typing import TYPE_CHECKING
+
+# pandas/numpy are imported where they are used: importing them takes most of
+# the start-up time, so the window comes up first and they load afterwards
+if TYPE_CHECKING:
+    import pandas as pd
+
+# timestamp layout of the target format (preview and export)
+OUTPUT_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# lower-case source column names tried for each target field, best match first
+SERIAL_HINTS = ("collar id", "serialnumber", "serial", "device_id", "deviceid", "id", "collar", "tag_id", "tag-id")
+TIME_HINTS = ("acq. time [utc]", "acq. time", "timestamp", "time", "datetime", "date_time", "fix_time", "gps_date", "acquisitiontime")
+LAT_HINTS = ("latitude [deg]", "latitude", "lat", "y")
+LON_HINTS = ("longitude [deg]", "longitude", "lon", "long", "x")
+COLUMN_HINTS = (SERIAL_HINTS, TIME_HINTS, LAT_HINTS, LON_HINTS)
 
 
 # ─── helpers ────────────────────────────────────────────────────────────────────
@@ -19,6 +37,15 @@ def detect_delimiter(filepath: str) -> str:
     """Sniff the delimiter of a CSV file."""
     with open(filepath, "r", encoding="utf-8-sig") as f:
         sample = f.read(8192)
+
+    # cheap check on the header line first; only run the Sniffer when the
+    # delimiter is ambiguous
+    first_line = sample.split("\n", 1)[0]
+    counts = {d: first_line.count(d) for d in ",;\t|"}
+    ranked = sorted(counts.values(), reverse=True)
+    if ranked[0] >= 3 * ranked[1] + 1:
+        return max(counts, key=counts.get)
+
     try:
         dialect = csv.Sniffer().sniff(sample, delimiters=",;\t|")
         return dialect.delimiter
@@ -28,9 +55,64 @@ def detect_delimiter(filepath: str) -> str:
 
 def load_csv(filepath: str) -> pd.DataFrame:
     """Load a CSV with auto-detected delimiter."""
+    import pandas as pd
+
     sep = detect_delimiter(filepath)
-    df = pd.read_csv(filepath, sep=sep, encoding="utf-8-sig", low_memory=False)
-    return df
+    try:
+        # multithreaded Arrow parser, much faster on large exports
+        return _read_csv_arrow(filepath, sep)
+    except Exception:
+        # pyarrow not installed, or the file is too irregular for it
+        df = pd.read_csv(filepath, sep=sep, encoding="utf-8-sig", low_memory=False)
+        return df
+
+
+def _read_csv_arrow(filepath: str, sep: str) -> pd.DataFrame:
+    """
+    Read a CSV with pyarrow, keeping date/time-like columns as text. pyarrow
+    would otherwise convert them (offsets to UTC) while loading, before the
+    user's timestamp format is applied. The column types are taken from the
+    first block, which is what pyarrow infers them from anyway.
+    """
+    import pyarrow as pa
+    from pyarrow import csv as pa_csv
+
+    parse_options = pa_csv.ParseOptions(delimiter=sep)
+    # same missing-value strings as pandas' C parser
+    null_values = pa_csv.ConvertOptions().null_values + ["<NA>", "None"]
+    convert_options = pa_csv.ConvertOptions(null_values=null_values, strings_can_be_null=True)
+
+    reader = pa_csv.open_csv(filepath, parse_options=parse_options, convert_options=convert_options)
+    try:
+        schema = reader.schema
+    finally:
+        reader.close()
+    if "" in schema.names or len(set(schema.names)) != len(schema.names):
+        # blank or repeated headers are renamed by pandas, leave them to it
+        raise ValueError("header needs pandas column name handling")
+
+    convert_options.column_types = {f.name: pa.string() for f in schema if pa.types.is_temporal(f.type)}
+    table = pa_csv.read_csv(filepath, parse_options=parse_options, convert_options=convert_options)
+    return table.to_pandas()
+
+
+def parse_timestamps(values: pd.Series, time_format: str | None) -> pd.Series:
+    """
+    Parse a column of timestamps. Collar exports repeat the same timestamp
+    strings a lot, so only the distinct values are parsed and then mapped back.
+    """
+    import pandas as pd
+
+    utc = time_format is None
+    # judge from a cheap sample whether factorising is worth it
+    sample = values.iloc[:10_000]
+    if len(sample) == 0 or sample.nunique() / len(sample) > 0.8:
+        # mostly distinct values – factorising would not save any work
+        return pd.to_datetime(values, format=time_format, errors="coerce", utc=utc)
+    codes, uniques = pd.factorize(values)
+    parsed = pd.to_datetime(uniques, format=time_format, errors="coerce", utc=utc)
+    # code -1 marks missing source values
+    return pd.Series(parsed.take(codes, allow_fill=True, fill_value=pd.NaT), index=values.index)
 
 
 def convert_data(
@@ -43,66 +125,122 @@ def convert_data(
     global_start: datetime | None,
     per_individual_starts: dict[str, datetime] | None,
     fix_duplicates: bool,
+    compact_coordinates: bool = False,
 ) -> pd.DataFrame:
     """
     Map columns, filter by date, handle duplicate timestamps, and return a
-    DataFrame in the target schema.
+    DataFrame in the target schema. With *compact_coordinates* latitude and
+    longitude are stored as float32, halving their memory at ~1 m precision.
     """
-    out = pd.DataFrame()
-    out["serialnumber"] = df[col_serial].astype(str)
+    import numpy as np
+    import pandas as pd
+
+    # categorical codes make the filter, sort and groupby passes work on small
+    # integers instead of Python strings
+    serial = df[col_serial]
+    if not pd.api.types.is_string_dtype(serial):
+        # already-string columns (the usual case) skip the copy
+        serial = serial.astype(str)
+    serial = serial.astype("category")
 
     # parse timestamps
-    if time_format:
-        out["time"] = pd.to_datetime(df[col_time], format=time_format, errors="coerce")
-    else:
-        out["time"] = pd.to_datetime(df[col_time], errors="coerce", utc=True)
+    time = parse_timestamps(df[col_time], time_format)
+    if time.dt.tz is not None:
         # strip timezone info so comparisons with naive datetimes work
-        if out["time"].dt.tz is not None:
-            out["time"] = out["time"].dt.tz_localize(None)
+        time = time.dt.tz_localize(None)
 
-    out["latitude"] = pd.to_numeric(df[col_lat], errors="coerce")
-    out["longitude"] = pd.to_numeric(df[col_lon], errors="coerce")
+    downcast = "float" if compact_coordinates else None
+    latitude = pd.to_numeric(df[col_lat], errors="coerce", downcast=downcast)
+    longitude = pd.to_numeric(df[col_lon], errors="coerce", downcast=downcast)
 
-    # ── global date filter ──────────────────────────────────────────────────
-    if global_start is not None:
-        out = out[out["time"] >= global_start].copy()
+    # build the frame in one go rather than column by column
+    out = pd.DataFrame(
+        {"serialnumber": serial, "time": time, "latitude": latitude, "longitude": longitude},
+        copy=False,
+    )
 
-    # ── per-individual date filters ─────────────────────────────────────────
+    # ── date filters ────────────────────────────────────────────────────────
     if per_individual_starts:
-        masks = []
-        for serial, start_dt in per_individual_starts.items():
-            mask = (out["serialnumber"] == serial) & (out["time"] >= start_dt)
-            masks.append(mask)
-        # keep rows that either match a per-individual filter or whose serial
-        # has no specific filter defined
-        filtered_serials = set(per_individual_starts.keys())
-        mask_no_filter = ~out["serialnumber"].isin(filtered_serials)
-        combined = mask_no_filter
-        for m in masks:
-            combined = combined | m
-        out = out[combined].copy()
+        # one start date per serial category, gathered onto the rows through
+        # the codes. The global start is folded in: serials without their own
+        # start use it, the others use the later of the two.
+        categories = out["serialnumber"].cat.categories
+        # the extra last slot is picked up by code -1 (missing serial)
+        table = np.full(len(categories) + 1, np.datetime64("NaT"), dtype="datetime64[ns]")
+        lookup = categories.get_indexer(list(per_individual_starts))
+        found = lookup >= 0
+        table[lookup[found]] = np.array(list(per_individual_starts.values()), dtype="datetime64[ns]")[found]
+        if global_start is not None:
+            start = np.datetime64(global_start, "ns")
+            table = np.where(np.isnat(table), start, np.maximum(table, start))
+        thresholds = table[out["serialnumber"].cat.codes.to_numpy()]
+        keep = np.isnat(thresholds) | (out["time"].to_numpy() >= thresholds)
+        out = out.loc[keep]
+    elif global_start is not None:
+        if out["time"].is_monotonic_increasing:
+            # time-ordered file: binary search and slice instead of a full mask
+            out = out.iloc[out["time"].searchsorted(global_start):]
+        else:
+            out = out.loc[out["time"] >= global_start]
 
     # ── handle duplicate timestamps ─────────────────────────────────────────
     if fix_duplicates:
         out = out.sort_values(["serialnumber", "time", "latitude", "longitude"])
-        out["time"] = out.groupby(["serialnumber", "time"])["time"].transform(
-            lambda g: g + pd.to_timedelta(range(len(g)), unit="s")
-        )
+        # n-th repeat of a (serial, time) pair is shifted by n seconds
+        # dropna=False keeps rows with a missing serial in their own groups;
+        # a NaN offset would turn their time into NaT (NaT + n stays NaT)
+        offsets = out.groupby(["serialnumber", "time"], sort=False, observed=True, dropna=False).cumcount()
+        out["time"] = out["time"] + pd.to_timedelta(offsets.to_numpy(), unit="s")
+        # the shift can only push a fix past the next distinct timestamp when
+        # several duplicates are packed into consecutive seconds; re-sort then
+        if not _is_time_ordered(out):
+            out = out.sort_values(["serialnumber", "time"])
+    else:
+        out = out.sort_values(["serialnumber", "time"])
 
-    out = out.sort_values(["serialnumber", "time"]).reset_index(drop=True)
-    return out
+    return out.reset_index(drop=True)
 
 
-def export_csv(df: pd.DataFrame, filepath: str) -> None:
+def _is_time_ordered(df: pd.DataFrame) -> bool:
+    """Check that times never decrease within a serial of a serial-sorted frame."""
+    serial = df["serialnumber"].cat.codes.to_numpy()
+    time = df["time"].to_numpy()
+    same_serial = serial[1:] == serial[:-1]
+    return not (same_serial & (time[1:] < time[:-1])).any()
+
+
+def format_columns(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    Render the converted columns as output strings, one vectorised pass per
+    column. Shared by the preview and export_csv so neither formats per row.
+    """
+    import pandas as pd
+
+    return pd.DataFrame({
+        # astype(str) keeps missing values on pandas >= 3; write them as str() would
+        "serialnumber": df["serialnumber"].astype(str).fillna("nan"),
+        "time": df["time"].dt.strftime(OUTPUT_TIME_FORMAT).fillna(""),
+        "latitude": df["latitude"].map(lambda v: "" if pd.isna(v) else f"{v:.7f}").astype(str),
+        "longitude": df["longitude"].map(lambda v: "" if pd.isna(v) else f"{v:.7f}").astype(str),
+    })
+
+
+def export_csv(df: pd.DataFrame, filepath: str, chunk_rows: int = 100_000) -> None:
     """Write the converted data in the target format (semicolon-separated, quoted)."""
+    formatted = format_columns(df)
+    # lines are built with vectorised string ops instead of csv.writer, which
+    # was slower and needed more memory here; only serials can contain quotes,
+    # so they are escaped (doubled) by hand the way csv.writer would
+    serial = formatted["serialnumber"].str.replace('"', '""', regex=False)
+    lines = (
+        '"' + serial + '";"' + formatted["time"] + '";"'
+        + formatted["latitude"] + '";"' + formatted["longitude"] + '"\n'
+    ).tolist()
     with open(filepath, "w", newline="", encoding="utf-8") as f:
         f.write("serialnumber;time;latitude;longitude\n")
-        for _, row in df.iterrows():
-            serial = str(row["serialnumber"])
-            time_str = row["time"].strftime("%Y-%m-%d %H:%M:%S") if pd.notna(row["time"]) else ""
-            lat = f"{row['latitude']:.7f}" if pd.notna(row["latitude"]) else ""
-            lon = f"{row['longitude']:.7f}" if pd.notna(row["longitude"]) else ""
-            f.write(f'"{serial}";"{time_str}";"{lat}";"{lon}"\n')
+        # join in blocks to cap the size of the temporary string
+        for start in range(0, len(lines), chunk_rows):
+            f.write("".join(lines[start:start + chunk_rows]))
 
 
 # ─── GUI ────────────────────────────────────────────────────────────────────────
@@ -118,6 +256,11 @@ class ConverterApp(tk.Tk):
         self.converted_df: pd.DataFrame | None = None
         self.per_individual_starts: dict[str, datetime] = {}
 
+        # single worker so conversions and exports never overlap
+        self._executor = ThreadPoolExecutor(max_workers=1)
+        # warm up the pandas import while the user picks a file
+        self._executor.submit(importlib.import_module, "pandas")
+
         self._build_ui()
 
     # ── UI construction ─────────────────────────────────────────────────────
@@ -135,7 +278,8 @@ class ConverterApp(tk.Tk):
         ttk.Entry(file_frame, textvariable=self.file_var, state="readonly").pack(
             side="left", fill="x", expand=True, padx=(0, 6)
         )
-        ttk.Button(file_frame, text="Browse…", command=self._browse_file).pack(side="left")
+        self.browse_btn = ttk.Button(file_frame, text="Browse…", command=self._browse_file)
+        self.browse_btn.pack(side="left")
 
         # ── Column mapping ──────────────────────────────────────────────────
         map_frame = ttk.LabelFrame(main, text="2. Map Columns", padding=8)
@@ -143,12 +287,14 @@ class ConverterApp(tk.Tk):
 
         labels = ["Serial Number", "Timestamp", "Latitude", "Longitude"]
         self.combo_vars: list[tk.StringVar] = []
+        self._all_combos: list[ttk.Combobox] = []
         for i, label in enumerate(labels):
             ttk.Label(map_frame, text=f"{label}:").grid(row=i, column=0, sticky="w", padx=(0, 6), pady=2)
             var = tk.StringVar()
             combo = ttk.Combobox(map_frame, textvariable=var, state="readonly", width=40)
             combo.grid(row=i, column=1, sticky="w", pady=2)
             self.combo_vars.append(var)
+            self._all_combos.append(combo)
             if i == 1:
                 # Timestamp format entry next to the timestamp combo
                 ttk.Label(map_frame, text="Format (optional):").grid(row=i, column=2, sticky="w", padx=(12, 6))
@@ -183,6 +329,7 @@ class ConverterApp(tk.Tk):
         self.ind_serial_var = tk.StringVar()
         self.ind_serial_combo = ttk.Combobox(pf_inner, textvariable=self.ind_serial_var, state="readonly", width=18)
         self.ind_serial_combo.grid(row=0, column=1, sticky="w", padx=(0, 8))
+        self._all_combos.append(self.ind_serial_combo)
 
         ttk.Label(pf_inner, text="Start:").grid(row=0, column=2, sticky="w", padx=(0, 4))
         self.ind_start_var = tk.StringVar()
@@ -202,13 +349,19 @@ class ConverterApp(tk.Tk):
         ttk.Checkbutton(opt_frame, text="Fix duplicate timestamps (add 1 s increments)", variable=self.fix_dup_var).pack(
             anchor="w"
         )
+        self.compact_coords_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(
+            opt_frame, text="Reduce memory for coordinates (float32, ~1 m precision)", variable=self.compact_coords_var
+        ).pack(anchor="w")
 
         # ── Action buttons ──────────────────────────────────────────────────
         btn_frame = ttk.Frame(main)
         btn_frame.pack(fill="x", pady=(0, 6))
 
-        ttk.Button(btn_frame, text="Convert & Preview", command=self._convert).pack(side="left", padx=(0, 6))
-        ttk.Button(btn_frame, text="Export CSV…", command=self._export).pack(side="left")
+        self.convert_btn = ttk.Button(btn_frame, text="Convert & Preview", command=self._convert)
+        self.convert_btn.pack(side="left", padx=(0, 6))
+        self.export_btn = ttk.Button(btn_frame, text="Export CSV…", command=self._export)
+        self.export_btn.pack(side="left")
 
         self.status_var = tk.StringVar()
         ttk.Label(btn_frame, textvariable=self.status_var, foreground="green").pack(side="right")
@@ -253,8 +406,8 @@ class ConverterApp(tk.Tk):
             var.set("")
 
         # update all combo boxes with column names
-        for widget in self.winfo_children():
-            self._update_combos(widget, columns)
+        for combo in self._all_combos:
+            combo["values"] = columns
 
         # update individual serial combo (needs column mapping first, so populate later)
         self.ind_serial_combo["values"] = []
@@ -266,24 +419,11 @@ class ConverterApp(tk.Tk):
         # ── auto-guess column mappings ──────────────────────────────────────
         self._auto_map(columns)
 
-    def _update_combos(self, widget, columns):
-        """Recursively set combobox values."""
-        if isinstance(widget, ttk.Combobox):
-            widget["values"] = columns
-        for child in widget.winfo_children():
-            self._update_combos(child, columns)
-
     def _auto_map(self, columns: list[str]):
         """Try to guess which columns match the 4 target fields."""
         lower_cols = {c.lower(): c for c in columns}
 
-        serial_hints = ["collar id", "serialnumber", "serial", "device_id", "deviceid", "id", "collar", "tag_id", "tag-id"]
-        time_hints = ["acq. time [utc]", "acq. time", "timestamp", "time", "datetime", "date_time", "fix_time", "gps_date", "acquisitiontime"]
-        lat_hints = ["latitude [deg]", "latitude", "lat", "y"]
-        lon_hints = ["longitude [deg]", "longitude", "lon", "long", "x"]
-
-        mapping = [serial_hints, time_hints, lat_hints, lon_hints]
-        for i, hints in enumerate(mapping):
+        for i, hints in enumerate(COLUMN_HINTS):
             for hint in hints:
                 if hint in lower_cols:
                     self.combo_vars[i].set(lower_cols[hint])
@@ -315,7 +455,7 @@ class ConverterApp(tk.Tk):
         if not self.per_individual_starts:
             self.ind_filters_var.set("(none)")
         else:
-            parts = [f"{s}: {d.strftime('%Y-%m-%d %H:%M:%S')}" for s, d in self.per_individual_starts.items()]
+            parts = [f"{s}: {d.strftime(OUTPUT_TIME_FORMAT)}" for s, d in self.per_individual_starts.items()]
             self.ind_filters_var.set(" | ".join(parts))
 
     def _get_mappings(self) -> tuple[str, str, str, str] | None:
@@ -353,33 +493,36 @@ class ConverterApp(tk.Tk):
         global_start = self._parse_global_start()
         time_fmt = self.time_fmt_var.get().strip() or None
 
-        try:
-            self.converted_df = convert_data(
-                df=self.source_df,
-                col_serial=col_serial,
-                col_time=col_time,
-                col_lat=col_lat,
-                col_lon=col_lon,
-                time_format=time_fmt,
-                global_start=global_start,
-                per_individual_starts=self.per_individual_starts or None,
-                fix_duplicates=self.fix_dup_var.get(),
-            )
-        except Exception as e:
-            messagebox.showerror("Conversion error", str(e))
-            return
+        self.status_var.set("Converting…")
+        self._run_in_background(
+            convert_data,
+            self._show_converted,
+            "Conversion error",
+            df=self.source_df,
+            col_serial=col_serial,
+            col_time=col_time,
+            col_lat=col_lat,
+            col_lon=col_lon,
+            time_format=time_fmt,
+            global_start=global_start,
+            # copy, the filters may be edited while the worker runs
+            per_individual_starts=dict(self.per_individual_starts) or None,
+            fix_duplicates=self.fix_dup_var.get(),
+            compact_coordinates=self.compact_coords_var.get(),
+        )
+
+    def _show_converted(self, converted_df: pd.DataFrame):
+        self.converted_df = converted_df
 
         # populate individual serial combo now that we know serials
-        serials = sorted(self.converted_df["serialnumber"].unique())
+        serials = sorted(self.converted_df["serialnumber"].dropna().unique())
         self.ind_serial_combo["values"] = serials
 
         # populate preview tree
         self.tree.delete(*self.tree.get_children())
-        for _, row in self.converted_df.head(500).iterrows():
-            time_str = row["time"].strftime("%Y-%m-%d %H:%M:%S") if pd.notna(row["time"]) else ""
-            lat_str = f"{row['latitude']:.7f}" if pd.notna(row["latitude"]) else ""
-            lon_str = f"{row['longitude']:.7f}" if pd.notna(row["longitude"]) else ""
-            self.tree.insert("", "end", values=(row["serialnumber"], time_str, lat_str, lon_str))
+        preview = format_columns(self.converted_df.head(500))
+        for values in preview.itertuples(index=False, name=None):
+            self.tree.insert("", "end", values=values)
 
         n = len(self.converted_df)
         shown = min(n, 500)
@@ -397,14 +540,43 @@ class ConverterApp(tk.Tk):
         )
         if not path:
             return
-        try:
-            export_csv(self.converted_df, path)
+
+        def done(_):
             self.status_var.set(f"Exported {len(self.converted_df)} rows → {os.path.basename(path)}")
             messagebox.showinfo("Done", f"File saved:\n{path}")
+
+        self.status_var.set("Exporting…")
+        self._run_in_background(export_csv, done, "Export error", df=self.converted_df, filepath=path)
+
+    # ── background work ─────────────────────────────────────────────────────
+
+    def _run_in_background(self, func, on_success, error_title: str, **kwargs):
+        """Run *func* on the worker thread; *on_success* gets its result on the Tk thread."""
+        self._set_busy(True)
+        future = self._executor.submit(func, **kwargs)
+        self.after(50, self._poll_future, future, on_success, error_title)
+
+    def _poll_future(self, future: Future, on_success, error_title: str):
+        if not future.done():
+            self.after(50, self._poll_future, future, on_success, error_title)
+            return
+        self._set_busy(False)
+        try:
+            result = future.result()
         except Exception as e:
-            messagebox.showerror("Export error", str(e))
+            self.status_var.set("")
+            messagebox.showerror(error_title, str(e))
+            return
+        on_success(result)
+
+    def _set_busy(self, busy: bool):
+        state = "disabled" if busy else "normal"
+        for btn in (self.browse_btn, self.convert_btn, self.export_btn):
+            btn.configure(state=state)
 
     def _show_about(self):
+        import webbrowser
+
         win = tk.Toplevel(self)
         win.title("About")
         win.geometry("480x360")
@@ -529,7 +701,12 @@ class ConverterApp(tk.Tk):
              "combinations (e.g. re-transmitted fixes). When this option is "
              "enabled, duplicate timestamps within the same individual are "
              "offset by 1-second increments so every row has a unique time. "
-             "This is required by most movement-analysis packages.\n\n"),
+             "This is required by most movement-analysis packages.\n\n"
+             "Reduce memory for coordinates:\n"
+             "Stores latitude and longitude in single precision, which halves "
+             "their memory use on very large files. Precision drops to about "
+             "1 m, so the last decimal places of the exported coordinates may "
+             "differ from the source. Leave it off unless memory is tight.\n\n"),
 
             ("subheading", "Step 5 – Convert & Preview\n"),
             (None,
@@ -554,8 +731,9 @@ class ConverterApp(tk.Tk):
              "file is a well-formed CSV/TXT with a header row.\n"
              "• Rows with unparseable timestamps or coordinates are kept but "
              "will have empty values – review them in the preview.\n"
-             "• Very large files (>1 M rows) may take a moment to convert; "
-             "the window may appear unresponsive briefly.\n"
+             "• Very large files (>1 M rows) may take a moment to convert or "
+             "export; this runs in the background and the buttons are "
+             "disabled until it finishes.\n"
              "• The converter reads the file as UTF-8. If your file uses a "
              "different encoding, re-save it as UTF-8 first.\n"),
         ]